@@ -10,16 +10,26 @@ import random
 import string
 import time
 import argparse
+import itertools
 from datetime import datetime
-from dataclasses import dataclass
-from typing import Literal
+from typing import Dict, List, Literal, NamedTuple, Tuple, Union
 import json
+import math
 import ssl
+import sys
+from urllib.parse import urlsplit
 
 # Configuration
 TENANTS = ["acme_corp", "beta_inc", "gamma_llc", "delta_io", "epsilon_tech"]
+TENANT_INDEX = {t: i for i, t in enumerate(TENANTS)}
+JSON_HEADERS = {"Content-Type": "application/json"}
+TXT_HEADERS = {t: {"Content-Type": "text/plain", "X-Tenant-ID": t} for t in TENANTS}
 REQUEST_RATE = 2000  # requests per minute
 DURATION_SECONDS = 60  # default test duration
+KEEPALIVE_TIMEOUT = 120  # seconds an idle pooled connection is kept open
+DNS_CACHE_TTL = 300  # seconds a resolved host is reused by the connector
+PROGRESS_INTERVAL = 1  # seconds between progress lines
+PAYLOAD_POOL_SIZE = 1024  # distinct log texts generated up front per run
 
 # Sample log messages for realistic testing
 SAMPLE_LOGS = [
@@ -40,9 +50,22 @@ SAMPLE_LOGS = [
     "Load balancer health check passed",
 ]
 
+# Filler characters and RNG for random text, built once instead of per call
+TEXT_CHARS = string.ascii_letters + string.digits + " "
+TEXT_RNG = random.Random()
 
-@dataclass
-class RequestResult:
+# The worker dedupes on log_id, so IDs must be unique across runs as well as
+# within one: a per-process timestamp prefix plus a sequence number.
+LOG_ID_PREFIX = f"log_{int(time.time() * 1000):x}_{random.getrandbits(16):04x}"
+LOG_ID_COUNTER = itertools.count()
+
+# Placeholder filled in per request in pre-encoded JSON bodies. Braces never
+# appear in tenant names or generated text, so it only matches the log_id.
+LOG_ID_SLOT = "{log_id}"
+LOG_ID_SLOT_BYTES = LOG_ID_SLOT.encode()
+
+
+class RequestResult(NamedTuple):
     success: bool
     status_code: int
     response_time: float
@@ -51,42 +74,137 @@ class RequestResult:
     error: str = ""
 
 
+class Admission:
+    """Caps in-flight requests with a counter guarded by a condition."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.active = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.active < self.capacity)
+            self.active += 1
+
+    async def release(self):
+        async with self._cond:
+            self.active -= 1
+            self._cond.notify(1)
+
+
+class LatencyHistogram:
+    """Log-bucketed latency histogram; quantiles within ~1% in bounded memory."""
+
+    def __init__(self, precision: float = 0.01):
+        self._log_base = math.log1p(precision)
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        idx = math.floor(math.log(max(value, 1e-6)) / self._log_base)
+        self.buckets[idx] = self.buckets.get(idx, 0) + 1
+
+    def quantile(self, q: float) -> float:
+        """Approximate the value at sorted index int(count * q)."""
+        rank = min(int(self.count * q), self.count - 1)
+        seen = 0
+        for idx in sorted(self.buckets):
+            seen += self.buckets[idx]
+            if seen > rank:
+                midpoint = math.exp((idx + 0.5) * self._log_base)
+                return min(max(midpoint, self.min), self.max)
+        return self.max
+
+
+class RunStats:
+    """Folds request results into summary counters in a single pass."""
+
+    def __init__(self):
+        self.total = 0
+        self.successful = 0
+        self.json_requests = 0
+        self.txt_requests = 0
+        self.latency = LatencyHistogram()
+        self.status_codes: Dict[Union[int, str], int] = {}
+        self.tenant_counts = [0] * len(TENANTS)  # indexed like TENANTS
+        self.errors: Dict[str, int] = {}
+
+    def add(self, r: RequestResult):
+        self.total += 1
+        if r.success:
+            self.successful += 1
+            self.latency.add(r.response_time)
+        if r.request_type == "json":
+            self.json_requests += 1
+        else:
+            self.txt_requests += 1
+        code = r.status_code if r.status_code else "Error"
+        self.status_codes[code] = self.status_codes.get(code, 0) + 1
+        self.tenant_counts[TENANT_INDEX[r.tenant_id]] += 1
+        if r.error:
+            self.errors[r.error] = self.errors.get(r.error, 0) + 1
+
+    def latency_summary(self) -> Tuple[float, float, float, float, float, float]:
+        """Return (avg, min, max, p50, p95, p99) of successful response times."""
+        h = self.latency
+        if not h.count:
+            return 0, 0, 0, 0, 0, 0
+        return (
+            h.sum / h.count,
+            h.min,
+            h.max,
+            h.quantile(0.50),
+            h.quantile(0.95),
+            h.quantile(0.99),
+        )
+
+
 def generate_random_text(min_len: int = 50, max_len: int = 200) -> str:
     """Generate random log-like text."""
-    base = random.choice(SAMPLE_LOGS)
-    extra_len = random.randint(min_len, max_len) - len(base)
+    base = TEXT_RNG.choice(SAMPLE_LOGS)
+    extra_len = TEXT_RNG.randint(min_len, max_len) - len(base)
     if extra_len > 0:
-        extra = " " + "".join(random.choices(string.ascii_letters + string.digits + " ", k=extra_len))
-        return base + extra
+        return base + " " + "".join(TEXT_RNG.choices(TEXT_CHARS, k=extra_len))
     return base
 
 
 def generate_log_id() -> str:
     """Generate a unique log ID."""
-    return f"log_{int(time.time() * 1000)}_{random.randint(1000, 9999)}"
+    return f"{LOG_ID_PREFIX}_{next(LOG_ID_COUNTER):x}"
+
+
+def build_json_template(tenant_id: str, text: str) -> bytes:
+    """Pre-encode a JSON payload with a placeholder where the log ID goes."""
+    return json.dumps(
+        {"tenant_id": tenant_id, "log_id": LOG_ID_SLOT, "text": text},
+        separators=(",", ":"),
+    ).encode()
 
 
 async def send_json_request(
     session: aiohttp.ClientSession, 
     url: str, 
-    tenant_id: str
+    tenant_id: str,
+    template: bytes
 ) -> RequestResult:
     """Send a JSON payload request."""
-    log_id = generate_log_id()
-    text = generate_random_text()
+    body = template.replace(LOG_ID_SLOT_BYTES, generate_log_id().encode(), 1)
     
-    payload = {
-        "tenant_id": tenant_id,
-        "log_id": log_id,
-        "text": text
-    }
-    
-    headers = {"Content-Type": "application/json"}
-    
-    start_time = time.time()
+    start_time = time.monotonic()
     try:
-        async with session.post(url, json=payload, headers=headers, timeout=10) as response:
-            response_time = time.time() - start_time
+        async with session.post(url, data=body, headers=JSON_HEADERS, timeout=10) as response:
+            response_time = time.monotonic() - start_time
+            # Drain the (small) ack body so aiohttp returns the connection to
+            # the pool on exit; an unread body makes it close the connection.
+            await response.read()
             return RequestResult(
                 success=response.status in [200, 201, 202],
                 status_code=response.status,
@@ -98,7 +216,7 @@ async def send_json_request(
         return RequestResult(
             success=False,
             status_code=0,
-            response_time=time.time() - start_time,
+            response_time=time.monotonic() - start_time,
             request_type="json",
             tenant_id=tenant_id,
             error="Timeout"
@@ -107,7 +225,7 @@ async def send_json_request(
         return RequestResult(
             success=False,
             status_code=0,
-            response_time=time.time() - start_time,
+            response_time=time.monotonic() - start_time,
             request_type="json",
             tenant_id=tenant_id,
             error=str(e)
@@ -117,20 +235,17 @@ async def send_json_request(
 async def send_txt_request(
     session: aiohttp.ClientSession, 
     url: str, 
-    tenant_id: str
+    tenant_id: str,
+    text: str
 ) -> RequestResult:
     """Send a raw text payload request."""
-    text = generate_random_text()
-    
-    headers = {
-        "Content-Type": "text/plain",
-        "X-Tenant-ID": tenant_id
-    }
-    
-    start_time = time.time()
+    start_time = time.monotonic()
     try:
-        async with session.post(url, data=text, headers=headers, timeout=10) as response:
-            response_time = time.time() - start_time
+        async with session.post(url, data=text, headers=TXT_HEADERS[tenant_id], timeout=10) as response:
+            response_time = time.monotonic() - start_time
+            # Drain the (small) ack body so aiohttp returns the connection to
+            # the pool on exit; an unread body makes it close the connection.
+            await response.read()
             return RequestResult(
                 success=response.status in [200, 201, 202],
                 status_code=response.status,
@@ -142,7 +257,7 @@ async def send_txt_request(
         return RequestResult(
             success=False,
             status_code=0,
-            response_time=time.time() - start_time,
+            response_time=time.monotonic() - start_time,
             request_type="txt",
             tenant_id=tenant_id,
             error="Timeout"
@@ -151,7 +266,7 @@ async def send_txt_request(
         return RequestResult(
             success=False,
             status_code=0,
-            response_time=time.time() - start_time,
+            response_time=time.monotonic() - start_time,
             request_type="txt",
             tenant_id=tenant_id,
             error=str(e)
@@ -161,17 +276,36 @@ async def send_txt_request(
 async def fire_request(
     session: aiohttp.ClientSession, 
     url: str, 
-    semaphore: asyncio.Semaphore
+    admission: Admission,
+    payloads: List[str],
+    json_templates: Dict[str, List[bytes]]
 ) -> RequestResult:
     """Fire a single request (randomly JSON or TXT)."""
-    async with semaphore:
+    await admission.acquire()
+    try:
         tenant_id = random.choice(TENANTS)
+        k = random.randrange(len(payloads))
         
         # 50/50 split between JSON and TXT
         if random.random() < 0.5:
-            return await send_json_request(session, url, tenant_id)
+            return await send_json_request(session, url, tenant_id, json_templates[tenant_id][k])
         else:
-            return await send_txt_request(session, url, tenant_id)
+            return await send_txt_request(session, url, tenant_id, payloads[k])
+    finally:
+        await admission.release()
+
+
+async def warm_up_connections(session: aiohttp.ClientSession, url: str, count: int):
+    """Open `count` pooled connections by hitting the service root concurrently."""
+    parts = urlsplit(url)
+    root_url = f"{parts.scheme}://{parts.netloc}/"
+    
+    async def ping():
+        async with session.get(root_url, timeout=10) as response:
+            await response.read()
+    
+    results = await asyncio.gather(*(ping() for _ in range(count)), return_exceptions=True)
+    return sum(1 for r in results if not isinstance(r, BaseException))
 
 
 async def run_chaos_test(
@@ -179,7 +313,9 @@ async def run_chaos_test(
     rpm: int = REQUEST_RATE, 
     duration: int = DURATION_SECONDS,
     max_concurrent: int = 100,
-    skip_ssl: bool = False
+    skip_ssl: bool = False,
+    warmup: bool = True,
+    burst: int = 1
 ):
     """Run the chaos test."""
     print(f"""
@@ -201,10 +337,13 @@ async def run_chaos_test(
     
     print(f"📊 Planning to send {total_requests} total requests")
     print(f"⏱️  Interval between requests: {interval*1000:.2f}ms")
+    if burst > 1:
+        print(f"💥 Firing in bursts of {burst} every {burst*interval*1000:.2f}ms")
     print(f"🚀 Starting chaos test at {datetime.now().isoformat()}\n")
     
-    semaphore = asyncio.Semaphore(max_concurrent)
-    results: list[RequestResult] = []
+    admission = Admission(max_concurrent)
+    payloads = [generate_random_text() for _ in range(PAYLOAD_POOL_SIZE)]
+    json_templates = {t: [build_json_template(t, p) for p in payloads] for t in TENANTS}
     
     # SSL configuration
     if skip_ssl:
@@ -212,79 +351,88 @@ async def run_chaos_test(
     else:
         ssl_context = None  # Use system default SSL
     
-    connector = aiohttp.TCPConnector(limit=max_concurrent, limit_per_host=max_concurrent, ssl=ssl_context)
+    # Keep idle connections pooled for the whole run (aiohttp drops them after
+    # 15s by default) so requests don't keep paying TCP/TLS handshakes.
+    connector = aiohttp.TCPConnector(
+        limit=max_concurrent,
+        limit_per_host=max_concurrent,
+        ssl=ssl_context,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=DNS_CACHE_TTL,
+    )
     timeout = aiohttp.ClientTimeout(total=30)
     
+    loop = asyncio.get_running_loop()
+    
+    # Results are folded into the stats as each request completes, so only
+    # in-flight tasks are kept alive rather than one per request in the run.
+    stats = RunStats()
+    pending = set()
+    
+    def collect(task: asyncio.Task):
+        pending.discard(task)
+        if not task.cancelled() and task.exception() is None:
+            stats.add(task.result())
+    
     async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-        tasks = []
-        start_time = time.time()
+        # Resolve DNS and complete TCP/TLS handshakes before the clock starts
+        if warmup:
+            warmed = await warm_up_connections(session, url, max_concurrent)
+            print(f"🔥 Warmed up {warmed}/{max_concurrent} connections\n")
+        
+        start = loop.time()
+        sent = 0
+        
+        # Progress is printed from its own task on a timer so the dispatch
+        # loop never blocks on stdout
+        async def report_progress():
+            while True:
+                await asyncio.sleep(PROGRESS_INTERVAL)
+                elapsed = loop.time() - start
+                current_rpm = sent / elapsed * 60 if elapsed > 0 else 0
+                print(f"📤 Sent {sent}/{total_requests} requests | Done: {stats.total} | Elapsed: {elapsed:.1f}s | Current RPM: {current_rpm:.0f}")
+        
+        progress = asyncio.create_task(report_progress())
         
         for i in range(total_requests):
-            # Schedule the request
-            task = asyncio.create_task(fire_request(session, url, semaphore))
-            tasks.append(task)
+            # Rate limiting: request i is due at start + i * interval. Only sleep
+            # when ahead of schedule; requests that are already due fire back to
+            # back so sleep overshoot never accumulates into a lower RPM. With
+            # burst > 1, only the first request of each burst waits.
+            if i % burst == 0:
+                delay = start + i * interval - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
             
-            # Progress update every 100 requests
-            if (i + 1) % 100 == 0:
-                elapsed = time.time() - start_time
-                current_rpm = (i + 1) / elapsed * 60 if elapsed > 0 else 0
-                print(f"📤 Sent {i + 1}/{total_requests} requests | Elapsed: {elapsed:.1f}s | Current RPM: {current_rpm:.0f}")
-            
-            # Rate limiting
-            await asyncio.sleep(interval)
+            # Schedule the request
+            task = asyncio.create_task(fire_request(session, url, admission, payloads, json_templates))
+            pending.add(task)
+            task.add_done_callback(collect)
+            sent += 1
         
+        progress.cancel()
         print(f"\n⏳ Waiting for all responses...")
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-    
-    # Process results
-    valid_results = [r for r in results if isinstance(r, RequestResult)]
+        if pending:
+            await asyncio.wait(pending)
     
     # Calculate statistics
-    total_time = time.time() - start_time
-    successful = sum(1 for r in valid_results if r.success)
-    failed = len(valid_results) - successful
-    
-    json_requests = [r for r in valid_results if r.request_type == "json"]
-    txt_requests = [r for r in valid_results if r.request_type == "txt"]
-    
-    response_times = [r.response_time for r in valid_results if r.success]
-    avg_response_time = sum(response_times) / len(response_times) if response_times else 0
-    min_response_time = min(response_times) if response_times else 0
-    max_response_time = max(response_times) if response_times else 0
-    
-    # P50, P95, P99 latencies
-    sorted_times = sorted(response_times)
-    p50 = sorted_times[int(len(sorted_times) * 0.50)] if sorted_times else 0
-    p95 = sorted_times[int(len(sorted_times) * 0.95)] if sorted_times else 0
-    p99 = sorted_times[int(len(sorted_times) * 0.99)] if sorted_times else 0
-    
-    # Status code distribution
-    status_codes = {}
-    for r in valid_results:
-        code = r.status_code if r.status_code else "Error"
-        status_codes[code] = status_codes.get(code, 0) + 1
-    
-    # Tenant distribution
-    tenant_counts = {}
-    for r in valid_results:
-        tenant_counts[r.tenant_id] = tenant_counts.get(r.tenant_id, 0) + 1
-    
-    # Error analysis
-    errors = {}
-    for r in valid_results:
-        if r.error:
-            errors[r.error] = errors.get(r.error, 0) + 1
+    total_time = loop.time() - start
+    total = stats.total
+    successful = stats.successful
+    failed = total - successful
+    (avg_response_time, min_response_time, max_response_time,
+     p50, p95, p99) = stats.latency_summary()
     
     # Print results
     print(f"""
 ╔══════════════════════════════════════════════════════════════╗
 ║                      TEST RESULTS                            ║
 ╠══════════════════════════════════════════════════════════════╣
-║  Total Requests:     {len(valid_results):>6}                                ║
-║  Successful:         {successful:>6} ({successful/len(valid_results)*100:.1f}%)                         ║
-║  Failed:             {failed:>6} ({failed/len(valid_results)*100:.1f}%)                          ║
+║  Total Requests:     {total:>6}                                ║
+║  Successful:         {successful:>6} ({successful/total*100:.1f}%)                         ║
+║  Failed:             {failed:>6} ({failed/total*100:.1f}%)                          ║
 ║  Total Time:         {total_time:>6.1f}s                               ║
-║  Actual RPM:         {len(valid_results)/total_time*60:>6.0f}                                ║
+║  Actual RPM:         {total/total_time*60:>6.0f}                                ║
 ╠══════════════════════════════════════════════════════════════╣
 ║  LATENCY STATS                                               ║
 ║  ─────────────                                               ║
@@ -297,28 +445,30 @@ async def run_chaos_test(
 ╠══════════════════════════════════════════════════════════════╣
 ║  REQUEST TYPE BREAKDOWN                                      ║
 ║  ──────────────────────                                      ║
-║  JSON Requests:      {len(json_requests):>6} ({len(json_requests)/len(valid_results)*100:.1f}%)                         ║
-║  TXT Requests:       {len(txt_requests):>6} ({len(txt_requests)/len(valid_results)*100:.1f}%)                         ║
+║  JSON Requests:      {stats.json_requests:>6} ({stats.json_requests/total*100:.1f}%)                         ║
+║  TXT Requests:       {stats.txt_requests:>6} ({stats.txt_requests/total*100:.1f}%)                         ║
 ╚══════════════════════════════════════════════════════════════╝
     """)
     
     print("📊 Status Code Distribution:")
-    for code, count in sorted(status_codes.items(), key=lambda x: str(x[0])):
-        bar = "█" * int(count / len(valid_results) * 40)
+    for code, count in sorted(stats.status_codes.items(), key=lambda x: str(x[0])):
+        bar = "█" * int(count / total * 40)
         print(f"   {code}: {count:>5} {bar}")
     
     print("\n🏢 Tenant Distribution:")
-    for tenant, count in sorted(tenant_counts.items()):
-        bar = "█" * int(count / len(valid_results) * 40)
+    for tenant, count in sorted(zip(TENANTS, stats.tenant_counts)):
+        if not count:
+            continue
+        bar = "█" * int(count / total * 40)
         print(f"   {tenant}: {count:>5} {bar}")
     
-    if errors:
+    if stats.errors:
         print("\n⚠️  Errors:")
-        for error, count in sorted(errors.items(), key=lambda x: -x[1]):
+        for error, count in sorted(stats.errors.items(), key=lambda x: -x[1]):
             print(f"   {error}: {count}")
     
     # Determine pass/fail
-    success_rate = successful / len(valid_results) * 100 if valid_results else 0
+    success_rate = successful / total * 100 if total else 0
     
     print("\n" + "="*64)
     if success_rate >= 95 and avg_response_time < 1.0:
@@ -330,7 +480,7 @@ async def run_chaos_test(
     print("="*64)
     
     return {
-        "total_requests": len(valid_results),
+        "total_requests": total,
         "successful": successful,
         "failed": failed,
         "success_rate": success_rate,
@@ -357,16 +507,28 @@ Examples:
     parser.add_argument("--duration", type=int, default=60, help="Test duration in seconds (default: 60)")
     parser.add_argument("--concurrent", type=int, default=100, help="Max concurrent requests (default: 100)")
     parser.add_argument("--skip-ssl", action="store_true", help="Skip SSL certificate verification (for testing)")
+    parser.add_argument("--burst", type=int, default=1, help="Requests fired together per scheduler wakeup (default: 1)")
+    parser.add_argument("--no-warmup", action="store_true", help="Skip opening connections before the timed run")
     
     args = parser.parse_args()
     
+    # Use the libuv-based event loop when it's installed (not available on Windows)
+    if sys.platform != "win32":
+        try:
+            import uvloop
+            uvloop.install()
+        except ImportError:
+            pass
+    
     # Run the test
     asyncio.run(run_chaos_test(
         url=args.url,
         rpm=args.rpm,
         duration=args.duration,
         max_concurrent=args.concurrent,
-        skip_ssl=args.skip_ssl
+        skip_ssl=args.skip_ssl,
+        warmup=not args.no_warmup,
+        burst=max(1, args.burst)
     ))
 
 